@@ -3,177 +3,290 @@ import concurrent.futures
 import cProfile
 import io
 import logging
+import logging.handlers
 import multiprocessing
 import os
+import pstats
 import sys
 
 # Third-party
-from bs4 import BeautifulSoup
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Constants
 BASE_URL = "https://onlineredlineguide.com"
 OUTPUT_DIR = "output/reports"
 LOG_FILE_PATH = "output/logs/hotwheel_scrape.log"
+LOG_FORMAT = "%(asctime)s - PID=%(process)d TID=%(thread)d - %(levelname)s - %(message)s"
+PROFILE_FILE_PATH = "output/logs/hotwheel_scrape.prof"
+HTTP_CACHE_PATH = "output/cache/http"
+HTTP_CACHE_EXPIRE_AFTER = 86400  # seconds
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+MAX_WORKERS = 8  # Concurrent fetches per category, all sharing SESSION's pool
+
+RENAME_MAP = {
+    "Mongoose 2": "Mongoose II",
+    "Snake 2": "Snake II",
+    "Mongoose II Funny Car": "Mongoose II",
+    "Snake II Funny Car": "Snake II",
+    "Mongoose Funny Car": "Mongoose",
+    "Snake Funny Car": "Snake",
+    "Mongoose Funny Rail Dragster": "Mongoose Rail Dragster",
+    "Alive 55": "Alive '55",
+    "King Cuda": "King 'Cuda",
+    "Grasshopper": "Grass Hopper",
+}
+
+# Sorted parallel arrays so _finalize can rename with a vectorized lookup
+_RENAME_KEYS = np.array(sorted(RENAME_MAP), dtype=object)
+_RENAME_VALUES = np.array([RENAME_MAP[key] for key in _RENAME_KEYS], dtype=object)
 
 
 def setup_logging():
     """Set up the logging configuration."""
+    os.makedirs(os.path.dirname(LOG_FILE_PATH), exist_ok=True)
 
-    # Define the base and subdirectory paths
-    base_dir = "output"
-    subdirs = ["reports", "logs"]
+    # Idempotent, so repeated calls never stack duplicate handlers
+    if logging.getLogger().handlers:
+        return
 
-    # Create the base directory and subdirectories if they don't exist
-    if not os.path.exists(base_dir):
-        for subdir in subdirs:
-            os.makedirs(os.path.join(base_dir, subdir))
+    # The file is opened on first emit and written in batches of records;
+    # MemoryHandler still flushes immediately on ERROR and at shutdown
+    file_handler = logging.FileHandler(LOG_FILE_PATH, delay=True)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 
     logging.basicConfig(
         level=logging.INFO,  # Set logging level to INFO
-        format="%(asctime)s - PID=%(process)d TID=%(thread)d - %(levelname)s - %(message)s",
+        format=LOG_FORMAT,
         handlers=[
             logging.StreamHandler(sys.stdout),  # Log to standard output
-            logging.FileHandler(LOG_FILE_PATH),  # Log to a file
+            logging.handlers.MemoryHandler(capacity=100, target=file_handler),
         ],
     )
 
 
-# Initialize logging configuration
-setup_logging()
 logger = logging.getLogger(__name__)
 
 
-def log_message(msg):
-    """Log messages with standard format."""
-    logger.info(msg)
+def create_session(cache_name=None):
+    """Create an HTTP session that reuses pooled keep-alive connections.
 
+    When cache_name is given, responses are also cached on disk there.
+    """
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=32, max_retries=retries)
 
-def scrape_url(url, table_index, outfile, main_column_name):
-    """Scrape a URL, extract a table, and return a cleaned DataFrame."""
+    if cache_name is None:
+        session = requests.Session()
+    else:
+        # Expired entries are revalidated via ETag/Last-Modified, so unchanged
+        # pages come back as a 304 and are served from the cache
+        session = requests_cache.CachedSession(
+            cache_name,
+            expire_after=HTTP_CACHE_EXPIRE_AFTER,
+            allowable_codes=(200,),
+        )
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared across all fetches so every request to BASE_URL reuses one connection pool
+SESSION = create_session()
+
+
+def init_worker(log_queue):
+    """Set up logging and the on-disk HTTP cache in a pool worker."""
+    global SESSION
+
+    # Route log records to the parent process, which owns the handlers
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+
+    # Opened per worker, since an SQLite connection must not cross a fork
+    SESSION = create_session(HTTP_CACHE_PATH)
+
+
+def _finalize(vals, rename_map_keys, rename_map_vals):
+    """Drop blanks, rename, then sort and de-duplicate a flat array of names.
+
+    rename_map_keys must be sorted, with rename_map_vals aligned to it.
+    """
+    vals = vals[pd.notna(vals)]
+
+    # Binary-search every name at once; only exact key matches are renamed
+    idx = np.searchsorted(rename_map_keys, vals).clip(max=len(rename_map_keys) - 1)
+    vals = np.where(rename_map_keys[idx] == vals, rename_map_vals[idx], vals)
+
+    return np.unique(vals)
+
+
+def fetch_url(url, session=None):
+    """Fetch a URL and return (content, encoding), or None on failure.
+
+    encoding is what response.text would decode with: the Content-Type
+    charset, or requests' detected encoding if the header gives none.
+    """
+    session = session or SESSION
     try:
-        log_message(f"Fetching URL: {url}")
-        response = requests.get(url)
+        logger.info("Fetching URL: %s", url)
+        response = session.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
+        return response.content, response.encoding or response.apparent_encoding
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        table = soup.find("table")
+    except requests.RequestException as e:
+        logger.info("Error fetching the URL %s: %s", url, e)
+    except Exception:
+        logger.exception("Unexpected error fetching %s", url)
 
-        if table is None:
-            log_message(f"No table found at {url}.")
-            raise ValueError(f"No table found at {url}")
+    return None
 
-        df = pd.read_html(io.StringIO(str(table)))[table_index]
+
+def parse_and_write(url, content, encoding, table_index, outfile, main_column_name):
+    """Extract a table from fetched page content, save it, and return it."""
+    try:
+        # lxml decodes the raw bytes itself; it never sees the HTTP headers,
+        # so the charset from fetch_url is passed through explicitly.
+        # Tables come back in document order, so index 0 is the first <table>
+        try:
+            tables = pd.read_html(
+                io.BytesIO(content), flavor="lxml", encoding=encoding
+            )
+        except ValueError:
+            logger.info("No table found at %s.", url)
+            raise ValueError(f"No table found at {url}") from None
+
+        df = tables[table_index]
 
         # Special handling for snake_mongoose
         if "snake_mongoose" in outfile:
             df.iloc[:, 1] = np.nan
 
-        df = df.stack().reset_index(drop=True).to_frame(name=main_column_name)
-        df = df.sort_values(by=main_column_name)
+        vals = _finalize(df.to_numpy().ravel(), _RENAME_KEYS, _RENAME_VALUES)
 
-        rename_map = {
-            "Mongoose 2": "Mongoose II",
-            "Snake 2": "Snake II",
-            "Mongoose II Funny Car": "Mongoose II",
-            "Snake II Funny Car": "Snake II",
-            "Mongoose Funny Car": "Mongoose",
-            "Snake Funny Car": "Snake",
-            "Mongoose Funny Rail Dragster": "Mongoose Rail Dragster",
-            "Alive 55": "Alive '55",
-            "King Cuda": "King 'Cuda",
-            "Grasshopper": "Grass Hopper",
-        }
+        # Arrow-backed strings sort and group through Arrow compute kernels
+        df = pd.DataFrame({main_column_name: vals}, dtype="string[pyarrow]")
 
-        df[main_column_name] = df[main_column_name].replace(rename_map)
-        df = df.drop_duplicates()
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), outfile)
 
-        os.makedirs(os.path.dirname(outfile), exist_ok=True)
-        df.to_csv(outfile, index=False)
+        logger.info("Data saved to %s.", outfile)
+        return df
 
-        log_message(f"Data saved to {outfile}.")
-        return df.copy()
-
-    except requests.RequestException as e:
-        log_message(f"Error fetching the URL {url}: {e}")
     except ValueError as e:
-        log_message(f"ValueError: {e}")
+        logger.info("ValueError: %s", e)
     except Exception:
-        logger.exception(f"Unexpected error processing {url}")
+        logger.exception("Unexpected error processing %s", url)
 
     return None
 
 
+def scrape_url(url, table_index, outfile, main_column_name, session=None):
+    """Scrape a URL, extract a table, and return a cleaned DataFrame."""
+    page = fetch_url(url, session)
+    if page is None:
+        return None
+
+    content, encoding = page
+    return parse_and_write(
+        url, content, encoding, table_index, outfile, main_column_name
+    )
+
+
 def create_csv_files(main_column_name, data_dict, dict_key):
     """Create CSV files from scraped data and return a combined DataFrame."""
     all_df = []
 
-    def thread_target(url, table_index, outfile, main_column_name):
-        return scrape_url(url, table_index, outfile, main_column_name)
-
     try:
-        log_message(f"Starting CSV creation for {dict_key}.")
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = []
-            future_dict = {}
-
-            for row in zip(*data_dict.values()):
-                year_or_series, table_index = row
-                outfile = f"{OUTPUT_DIR}/hotwheels-{year_or_series}.csv"
-                url = f"{BASE_URL}/{year_or_series}.html"
-
-                future = executor.submit(
-                    thread_target, url, table_index, outfile, main_column_name
+        logger.info("Starting CSV creation for %s.", dict_key)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # Worker threads only fetch; this thread parses each page as soon
+            # as it arrives, overlapping parsing with the fetches in flight
+            future_dict = {
+                executor.submit(fetch_url, f"{BASE_URL}/{year_or_series}.html"): (
+                    year_or_series,
+                    table_index,
                 )
-                futures.append(future)
-                future_dict[future] = year_or_series
+                for year_or_series, table_index in zip(*data_dict.values())
+            }
 
-            for future in concurrent.futures.as_completed(futures):
-                df = future.result()
+            for future in concurrent.futures.as_completed(future_dict):
+                page = future.result()
+                if page is None:
+                    continue
+
+                content, encoding = page
+                year_or_series, table_index = future_dict[future]
+                df = parse_and_write(
+                    f"{BASE_URL}/{year_or_series}.html",
+                    content,
+                    encoding,
+                    table_index,
+                    f"{OUTPUT_DIR}/hotwheels-{year_or_series}.csv",
+                    main_column_name,
+                )
                 if df is not None:
-                    df[dict_key] = future_dict[future]
+                    df[dict_key] = year_or_series
                     all_df.append(df)
 
     except Exception:
-        log_message("Error occurred during CSV creation.")
+        logger.info("Error occurred during CSV creation.")
 
-    return pd.concat(all_df, ignore_index=True) if all_df else pd.DataFrame()
+    if not all_df:
+        return pd.DataFrame()
+    if len(all_df) == 1:
+        return all_df[0].reset_index(drop=True)
+    return pd.concat(all_df, ignore_index=True, copy=False)
 
 
 def create_combined_csv_file(main_column_name, all_years_df, all_series_df):
     """Create a combined CSV file from two DataFrames."""
-    expected_columns = {main_column_name, "Year", "Series"}
-    combined_columns = set(all_years_df.columns).union(all_series_df.columns)
-
-    if not expected_columns.issubset(combined_columns):
-        log_message("Missing expected columns. Skipping CSV and JSON creation.")
+    if not (
+        {main_column_name, "Year"}.issubset(all_years_df.columns)
+        and {main_column_name, "Series"}.issubset(all_series_df.columns)
+    ):
+        logger.info("Missing expected columns. Skipping CSV and JSON creation.")
         return
 
-    all_df = pd.concat([all_years_df, all_series_df], ignore_index=True)
+    # Unique, sorted values per casting without a Python callable per group
+    years_by_cast, series_by_cast = (
+        df[[main_column_name, column]]
+        .dropna()
+        .drop_duplicates()
+        .sort_values(column)
+        .groupby(main_column_name)[column]
+        .agg(list)
+        for df, column in ((all_years_df, "Year"), (all_series_df, "Series"))
+    )
 
+    # Both sides are indexed by casting, so align them with a hash join
     all_df = (
-        all_df.groupby(main_column_name)
-        .agg(
-            {
-                "Year": lambda x: sorted(set(x.dropna())),
-                "Series": lambda x: sorted(set(x.dropna())),
-            }
-        )
+        years_by_cast.to_frame()
+        .join(series_by_cast.to_frame(), how="outer")
+        .rename_axis(main_column_name)
         .reset_index()
     )
 
+    # Castings missing from one side get an empty list, not NaN
+    for column in ("Year", "Series"):
+        all_df[column] = [
+            values if isinstance(values, list) else [] for values in all_df[column]
+        ]
+
     csv_outfile = f"{OUTPUT_DIR}/redlines.csv"
     json_outfile = csv_outfile.replace(".csv", ".json")
 
-    os.makedirs(os.path.dirname(csv_outfile), exist_ok=True)
     all_df.sort_values(by=main_column_name, inplace=True)
     all_df.to_csv(csv_outfile, index=False)
 
-    log_message(f"CSV saved to {csv_outfile}.")
+    logger.info("CSV saved to %s.", csv_outfile)
     all_df.to_json(json_outfile, orient="records", indent=4)
-    log_message(f"JSON saved to {json_outfile}.")
+    logger.info("JSON saved to %s.", json_outfile)
 
 
 def create_years_dict():
@@ -205,35 +318,52 @@ def wrapper_create_csv_files(file_info):
 
 
 def main():
+    # Created once up front; scrape_url and create_combined_csv_file rely on it
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
     main_column_name = "Casting"
     years_dict = create_years_dict()
     series_dict = create_series_dict()
 
-    with multiprocessing.Pool() as pool:
-        log_message("Starting multiprocessing pool.")
+    file_infos = [
+        (main_column_name, years_dict, "Year"),
+        (main_column_name, series_dict, "Series"),
+    ]
 
-        # Pass the function directly to pool.map()
-        all_years_df = pool.map(
-            wrapper_create_csv_files, [(main_column_name, years_dict, "Year")]
-        )
-        all_series_df = pool.map(
-            wrapper_create_csv_files, [(main_column_name, series_dict, "Series")]
-        )
+    # Workers hand their records to this process, which owns the log handlers
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers)
+    listener.start()
 
-    log_message("Creating combined CSV and JSON files...")
-    create_combined_csv_file(main_column_name, all_years_df[0], all_series_df[0])
-    log_message("Finished creating combined files.")
+    try:
+        # One worker per category so years and series are scraped concurrently
+        with multiprocessing.Pool(
+            processes=len(file_infos),
+            initializer=init_worker,
+            initargs=(log_queue,),
+        ) as pool:
+            logger.info("Starting multiprocessing pool.")
+            all_years_df, all_series_df = pool.map(
+                wrapper_create_csv_files, file_infos
+            )
+            # Let workers exit cleanly so their queued records are flushed
+            pool.close()
+            pool.join()
+    finally:
+        listener.stop()
+
+    logger.info("Creating combined CSV and JSON files...")
+    create_combined_csv_file(main_column_name, all_years_df, all_series_df)
+    logger.info("Finished creating combined files.")
 
 
 if __name__ == "__main__":
-    profiler = cProfile.Profile()
-    profiler.enable()
-
-    main()
-
-    profiler.disable()
-
-    with open("output/logs/hotwheel_scrape_profile.log", "w") as f:
-        sys.stdout = f
-        profiler.print_stats(sort="time")
-        sys.stdout = sys.__stdout__
+    setup_logging()
+
+    # Profiling instruments every call, so it is opt-in
+    if os.environ.get("HOTWHEEL_PROFILE"):
+        with cProfile.Profile() as profiler:
+            main()
+        pstats.Stats(profiler).sort_stats("cumulative").dump_stats(PROFILE_FILE_PATH)
+    else:
+        main()
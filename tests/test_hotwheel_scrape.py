@@ -1,7 +1,11 @@
 from unittest.mock import patch, MagicMock
+import logging
+import logging.handlers
+import numpy as np
 import os
 import pandas as pd
 import pytest
+import requests_cache
 import sys
 import tempfile
 
@@ -9,12 +13,18 @@ import tempfile
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
 
 from hotwheel_scrape import (
+    _RENAME_KEYS,
+    _RENAME_VALUES,
+    _finalize,
+    create_session,
+    setup_logging,
     scrape_url,
     create_csv_files,
     create_combined_csv_file,
     create_years_dict,
     create_series_dict,
     wrapper_create_csv_files,
+    main,
 )
 
 # Sample HTML table for mocking
@@ -33,12 +43,12 @@ def tmp_output_dir():
         yield tmpdir
 
 
-@patch("hotwheel_scrape.requests.get")
-@patch("hotwheel_scrape.os.makedirs")
-def test_scrape_url_success(mock_makedirs, mock_get, tmp_output_dir):
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_success(mock_get, tmp_output_dir):
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.text = HTML_TABLE
+    mock_response.content = HTML_TABLE.encode()
+    mock_response.encoding = "utf-8"
     mock_get.return_value = mock_response
 
     outfile = os.path.join(tmp_output_dir, "test_output.csv")
@@ -50,25 +60,163 @@ def test_scrape_url_success(mock_makedirs, mock_get, tmp_output_dir):
     assert os.path.exists(outfile)
 
 
-@patch("hotwheel_scrape.requests.get")
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_renames_castings(mock_get, tmp_output_dir):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = HTML_TABLE.replace("Snake", "Snake 2").encode()
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    outfile = os.path.join(tmp_output_dir, "test_output.csv")
+    df = scrape_url("https://fakeurl.com", 0, outfile, "Casting")
+
+    assert sorted(df["Casting"]) == ["Mongoose", "Snake II"]
+
+
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_snake_mongoose_skips_second_column(mock_get, tmp_output_dir):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = b"""
+    <table>
+      <tr><td>Snake <a href="#">Funny Car</a></td><td>Ignored</td></tr>
+      <tr><td>Mongoose</td><td>Ignored</td><td>Wildcat</td></tr>
+    </table>
+    """
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    outfile = os.path.join(tmp_output_dir, "hotwheels-snake_mongoose.csv")
+    df = scrape_url("https://fakeurl.com", 0, outfile, "Casting")
+
+    assert list(df["Casting"]) == ["Mongoose", "Snake", "Wildcat"]
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        # <br> separates words, as it does in pd.read_html
+        (
+            b"<table><tr><td>Custom<br>Camaro</td><td>Snake</td></tr></table>",
+            ["Custom Camaro", "Snake"],
+        ),
+        # <thead> rows are column labels, even when made of <td> cells
+        (
+            b"<table><thead><tr><td>Name</td><td>Other</td></tr></thead>"
+            b"<tbody><tr><td>Snake</td><td>Mongoose</td></tr></tbody></table>",
+            ["Mongoose", "Snake"],
+        ),
+        # Leading all-<th> rows are labels; <th> cells in body rows are data
+        (
+            b"<table><tr><th>Name</th><th>Other</th></tr>"
+            b"<tr><th>Row A</th><td>Snake</td></tr>"
+            b"<tr><th>Row B</th><td>Mongoose</td></tr></table>",
+            ["Mongoose", "Row A", "Row B", "Snake"],
+        ),
+    ],
+)
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_matches_read_html_layout(
+    mock_get, content, expected, tmp_output_dir
+):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = content
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    outfile = os.path.join(tmp_output_dir, "test_output.csv")
+    df = scrape_url("https://fakeurl.com", 0, outfile, "Casting")
+
+    assert list(df["Casting"]) == expected
+
+
+@pytest.mark.parametrize("table_index, expected", [(0, ["Snake"]), (1, ["Mongoose"])])
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_ignores_hidden_and_empty_tables(
+    mock_get, table_index, expected, tmp_output_dir
+):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = b"""
+    <table style="display: none"><tr><td>Zzz</td></tr></table>
+    <table></table>
+    <table><tr><td>Snake</td></tr></table>
+    <table><tr><td>Mongoose</td><td>N/A</td></tr></table>
+    """
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    outfile = os.path.join(tmp_output_dir, "test_output.csv")
+    df = scrape_url("https://fakeurl.com", table_index, outfile, "Casting")
+
+    assert list(df["Casting"]) == expected
+
+
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_snake_mongoose_skips_spanned_second_column(
+    mock_get, tmp_output_dir
+):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = b"""
+    <table>
+      <tr><td colspan="2">Wide One</td><td>Snake</td></tr>
+      <tr><td rowspan="2">Tall</td><td>Ignored</td><td>Mongoose</td></tr>
+      <tr><td>Also Ignored</td><td>Wildcat</td></tr>
+    </table>
+    """
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    outfile = os.path.join(tmp_output_dir, "hotwheels-snake_mongoose.csv")
+    df = scrape_url("https://fakeurl.com", 0, outfile, "Casting")
+
+    assert list(df["Casting"]) == ["Mongoose", "Snake", "Tall", "Wide One", "Wildcat"]
+
+
+def test_finalize():
+    vals = np.array(["Snake 2", "Beatnik Bandit", np.nan, "Snake II", "Zzz"], dtype=object)
+    result = _finalize(vals, _RENAME_KEYS, _RENAME_VALUES)
+    assert list(result) == ["Beatnik Bandit", "Snake II", "Zzz"]
+
+
+@patch("hotwheel_scrape.SESSION.get")
+def test_scrape_url_uses_header_charset(mock_get, tmp_output_dir):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    # No <meta charset>, so only the Content-Type charset identifies UTF-8
+    mock_response.content = "<table><tr><td>Café ’Cuda</td></tr></table>".encode()
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    outfile = os.path.join(tmp_output_dir, "test_output.csv")
+    df = scrape_url("https://fakeurl.com", 0, outfile, "Casting")
+
+    assert list(df["Casting"]) == ["Café ’Cuda"]
+
+
+@patch("hotwheel_scrape.SESSION.get")
 def test_scrape_url_no_table(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.text = "<html><body>No table here</body></html>"
+    mock_response.content = b"<html><body>No table here</body></html>"
+    mock_response.encoding = "utf-8"
     mock_get.return_value = mock_response
 
     result = scrape_url("https://fakeurl.com", 0, "irrelevant.csv", "Casting")
     assert result is None
 
 
-@patch("hotwheel_scrape.requests.get")
+@patch("hotwheel_scrape.SESSION.get")
 def test_scrape_url_invalid_url(mock_get):
     mock_get.side_effect = Exception("Connection error")
     result = scrape_url("https://invalidurl.com", 0, "dummy.csv", "Casting")
     assert result is None
 
 
-@patch("hotwheel_scrape.requests.get")
+@patch("hotwheel_scrape.SESSION.get")
 def test_scrape_url_timeout(mock_get):
     from requests.exceptions import Timeout
 
@@ -77,21 +225,23 @@ def test_scrape_url_timeout(mock_get):
     assert result is None
 
 
-@patch("hotwheel_scrape.requests.get")
+@patch("hotwheel_scrape.SESSION.get")
 def test_scrape_url_empty_table(mock_get):
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.text = "<table></table>"
+    mock_response.content = b"<table></table>"
+    mock_response.encoding = "utf-8"
     mock_get.return_value = mock_response
 
     result = scrape_url("https://fakeurl.com", 0, "dummy.csv", "Casting")
     assert result is None
 
 
-@patch("hotwheel_scrape.scrape_url")
-def test_create_csv_files(mock_scrape):
-    mock_df = pd.DataFrame({"Casting": ["Mongoose", "Snake"]})
-    mock_scrape.return_value = mock_df
+@patch("hotwheel_scrape.parse_and_write")
+@patch("hotwheel_scrape.fetch_url")
+def test_create_csv_files(mock_fetch, mock_parse):
+    mock_fetch.return_value = (HTML_TABLE.encode(), "utf-8")
+    mock_parse.return_value = pd.DataFrame({"Casting": ["Mongoose", "Snake"]})
 
     data_dict = {"year": ["1968"], "table_index": [0]}
     result_df = create_csv_files("Casting", data_dict, "Year")
@@ -136,21 +286,68 @@ def test_create_combined_csv_file_with_empty_df(tmp_output_dir):
         assert os.path.exists(os.path.join(tmp_output_dir, "redlines.csv"))
 
 
-@patch("hotwheel_scrape.os.makedirs")
-def test_file_write_permission_error(mock_makedirs):
-    mock_makedirs.side_effect = PermissionError("Permission denied")
+def test_create_combined_csv_file_missing_columns(tmp_output_dir):
+    df1 = pd.DataFrame()
+    df2 = pd.DataFrame({"Casting": ["Snake"], "Series": ["customs"]})
+
+    with patch("hotwheel_scrape.OUTPUT_DIR", tmp_output_dir):
+        create_combined_csv_file("Casting", df1, df2)
+        assert not os.path.exists(os.path.join(tmp_output_dir, "redlines.csv"))
+
+
+@patch("hotwheel_scrape.SESSION.get")
+@patch("hotwheel_scrape.pacsv.write_csv")
+def test_file_write_permission_error(mock_write_csv, mock_get):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = HTML_TABLE.encode()
+    mock_response.encoding = "utf-8"
+    mock_get.return_value = mock_response
+
+    mock_write_csv.side_effect = PermissionError("Permission denied")
     result = scrape_url("https://fakeurl.com", 0, "/forbidden/test.csv", "Casting")
     assert result is None
 
 
 @patch("hotwheel_scrape.logger.exception")
 def test_logging_exception_on_error(mock_exception):
-    with patch("hotwheel_scrape.requests.get", side_effect=Exception("Boom!")):
+    with patch("hotwheel_scrape.SESSION.get", side_effect=Exception("Boom!")):
         scrape_url("https://fakeurl.com", 0, "dummy.csv", "Casting")
 
     mock_exception.assert_called_once()
 
 
+def test_setup_logging_is_idempotent(tmp_output_dir, monkeypatch):
+    monkeypatch.chdir(tmp_output_dir)
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "handlers", [])
+
+    setup_logging()
+    setup_logging()
+
+    assert len(root.handlers) == 2
+    assert any(isinstance(h, logging.handlers.MemoryHandler) for h in root.handlers)
+    for handler in root.handlers:
+        handler.close()
+
+
+def test_create_session():
+    session = create_session()
+    adapter = session.get_adapter("https://onlineredlineguide.com")
+    assert adapter.max_retries.total == 3
+    assert adapter._pool_maxsize == 32
+
+
+def test_create_session_with_cache(tmp_output_dir):
+    cache_name = os.path.join(tmp_output_dir, "cache", "http")
+    session = create_session(cache_name)
+
+    assert isinstance(session, requests_cache.CachedSession)
+    assert session.settings.expire_after == 86400
+    assert session.get_adapter("https://onlineredlineguide.com").max_retries.total == 3
+    session.close()
+
+
 def test_create_years_dict():
     years = create_years_dict()
     assert "year" in years
@@ -165,6 +362,18 @@ def test_create_series_dict():
     assert len(series["series"]) == 7
 
 
+@patch("hotwheel_scrape.parse_and_write")
+@patch("hotwheel_scrape.fetch_url")
+def test_create_csv_files_skips_failed_fetch(mock_fetch, mock_parse):
+    mock_fetch.return_value = None
+
+    data_dict = {"year": ["1968"], "table_index": [0]}
+    result_df = create_csv_files("Casting", data_dict, "Year")
+
+    assert result_df.empty
+    mock_parse.assert_not_called()
+
+
 @patch("hotwheel_scrape.create_csv_files")
 def test_wrapper_create_csv_files(mock_create):
     mock_create.return_value = pd.DataFrame({"Casting": ["Test"]})
@@ -174,12 +383,31 @@ def test_wrapper_create_csv_files(mock_create):
     assert not result.empty
 
 
-@patch("hotwheel_scrape.scrape_url")
-def test_create_csv_files_with_failure(mock_scrape):
-    mock_scrape.side_effect = [None, pd.DataFrame({"Casting": ["Valid"]})]
+@patch("hotwheel_scrape.parse_and_write")
+@patch("hotwheel_scrape.fetch_url")
+def test_create_csv_files_with_failure(mock_fetch, mock_parse):
+    mock_fetch.return_value = (HTML_TABLE.encode(), "utf-8")
+    mock_parse.side_effect = [None, pd.DataFrame({"Casting": ["Valid"]})]
 
     data_dict = {"year": ["1968", "1969"], "table_index": [0, 0]}
     result_df = create_csv_files("Casting", data_dict, "Year")
 
     assert not result_df.empty
     assert "Casting" in result_df.columns
+
+
+@patch("hotwheel_scrape.create_combined_csv_file")
+@patch("hotwheel_scrape.multiprocessing.Pool")
+@patch("hotwheel_scrape.os.makedirs")
+def test_main_maps_both_categories_in_one_pool(mock_makedirs, mock_pool, mock_combined):
+    years_df = pd.DataFrame({"Casting": ["Snake"], "Year": ["1968"]})
+    series_df = pd.DataFrame({"Casting": ["Snake"], "Series": ["customs"]})
+    pool = mock_pool.return_value.__enter__.return_value
+    pool.map.return_value = [years_df, series_df]
+
+    main()
+
+    mock_makedirs.assert_called_once_with("output/reports", exist_ok=True)
+    pool.map.assert_called_once()
+    assert len(pool.map.call_args.args[1]) == 2
+    mock_combined.assert_called_once_with("Casting", years_df, series_df)